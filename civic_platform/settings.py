@@ -29,7 +29,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.getenv("SECRET_KEY")
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# on by default for development, set DEBUG=0 in .env when deploying
+DEBUG = os.getenv("DEBUG", "1") == "1"
 
 ALLOWED_HOSTS = ["*"]
 
@@ -46,14 +47,22 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "django.contrib.gis", 
-    "django_extensions",
     "crispy_forms",
 ]
 
+# django_extensions is a development tool (shell_plus, graph_models, ...),
+# so only pay for importing it when running with DEBUG=1
+if DEBUG:
+    INSTALLED_APPS.append("django_extensions")
+
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # serves collected static files before anything else touches the request
+    "civic_platform.staticfiles.StaticFilesMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
+    # before CsrfViewMiddleware, so throttled requests are rejected before their body is read
+    "the_archive.throttling.ThrottleMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
@@ -110,6 +119,23 @@ else:
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# the shared cache is seen by all workers (throttling, bookmark sets), the file based
+# cache works for a single host, point SHARED_CACHE_BACKEND to redis/memcached otherwise
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": os.getenv(
+            "SHARED_CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"
+        ),
+        "LOCATION": os.getenv("SHARED_CACHE_LOCATION", os.path.join(BASE_DIR, ".cache", "shared")),
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -145,6 +171,9 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.1/howto/static-files/
 
 STATIC_URL = "static/"
+# filled by `python manage.py collectstatic`, hashed names plus .gz and .br copies
+STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
+STATICFILES_STORAGE = "civic_platform.staticfiles.CompressedManifestStaticFilesStorage"
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
@@ -159,3 +188,49 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 LOGIN_REDIRECT_URL = '/'
 
 LOGIN_URL = 'login'
+
+# Rate limits, see the_archive/throttling.py
+THROTTLE_CACHE = "shared"
+THROTTLE_RATES = {
+    "upload": {
+        "user": "20/hour",
+        "ip": "40/hour",
+        "media_type": {"video": "5/hour", "audio": "10/hour"},
+    },
+    "comment": {"user": "10/minute", "ip": "30/minute"},
+    "register": {"ip": "5/hour"},
+}
+
+# Cold boot budget in seconds, up to a ready WSGI application, for `python manage.py startup_profile`
+# and the startup test in users/tests.py
+STARTUP_TIME_BUDGET = float(os.getenv("STARTUP_TIME_BUDGET", "3.0"))
+
+# Link previews, see the_archive/link_previews.py (times in seconds)
+LINK_PREVIEW_TTL = 7 * 24 * 3600
+LINK_PREVIEW_TIMEOUT = 5
+LINK_PREVIEW_PER_HOST = 2
+LINK_PREVIEW_MAX_ATTEMPTS = 5
+LINK_PREVIEW_RETRY_BACKOFF = 600
+
+# Document text extraction, see the_archive/extraction.py (times in seconds)
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "2"))
+EXTRACTION_TIMEOUT = 120
+EXTRACTION_MEMORY_LIMIT = 512 * 1024 * 1024
+EXTRACTION_MAX_CHARS = 5_000_000
+EXTRACTION_MAX_ATTEMPTS = 3
+
+# Related uploads, see the_archive/related.py
+RELATED_UPLOADS_K = 10
+RELATED_GEO_RADIUS_KM = 50
+RELATED_GEO_WEIGHT = 0.3
+
+# Bookmarked upload ids per user, see the_archive/bookmarks.py
+BOOKMARK_CACHE = "shared"
+BOOKMARK_CACHE_TIMEOUT = 24 * 3600
+BOOKMARKS_PER_PAGE = 20
+
+# Comment threads, see the_archive/comments.py
+COMMENTS_PER_PAGE = 50
+
+# Avatar sizes in pixels, see users/avatars.py
+AVATAR_SIZES = (32, 64, 128, 256)
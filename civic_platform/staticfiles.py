@@ -0,0 +1,161 @@
+"""
+Static files with content hashed names, compressed ahead of time.
+
+collectstatic writes every file under a name containing its hash (main.3f2a...css)
+plus a .gz and a .br copy, StaticFilesMiddleware then serves them straight from
+STATIC_ROOT without a separate web server. Hashed names never change content, so
+they are cached for a year and repeat visits download nothing.
+"""
+import gzip
+import json
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+
+COMPRESSIBLE = (".css", ".js", ".map", ".svg", ".txt", ".html", ".json", ".xml", ".ico")
+# below this size the compressed copy isn't worth the extra file
+MIN_SIZE = 256
+# preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, max-age=0, must-revalidate"
+
+
+def compress_file(path):
+    """ writes path.gz and path.br next to the file, where they are smaller than it """
+    with open(path, "rb") as file:
+        data = file.read()
+    if len(data) < MIN_SIZE:
+        return []
+
+    # imported here, only collectstatic needs it
+    import brotli
+
+    variants = [
+        (".gz", gzip.compress(data, compresslevel=9, mtime=0)),
+        (".br", brotli.compress(data, quality=11)),
+    ]
+    written = []
+    for extension, compressed in variants:
+        if len(compressed) < len(data):
+            with open(path + extension, "wb") as file:
+                file.write(compressed)
+            written.append(path + extension)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    manifest_strict = False
+
+    def stored_name(self, name):
+        """
+        the hashed name, or the plain one when collectstatic hasn't written the
+        file yet, so templates render in tests and on a fresh checkout
+        """
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            names.add(name)
+            if isinstance(hashed_name, str):
+                names.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                compress_file(self.path(name))
+
+
+def accepted_encodings(header):
+    """ the encodings of an Accept-Encoding header, without the ones refused with q=0 """
+    accepted = set()
+    for part in header.split(","):
+        encoding, _, params = part.partition(";")
+        name, _, quality = params.strip().partition("=")
+        try:
+            if name.strip() == "q" and float(quality) == 0:
+                continue
+        except ValueError:
+            pass
+        accepted.add(encoding.strip().lower())
+    return accepted
+
+
+class StaticFilesMiddleware:
+    """
+    Serves STATIC_ROOT under STATIC_URL, picking the brotli or gzip copy the
+    client accepts. Files listed in the staticfiles manifest under their hashed
+    name are immutable, everything else has to be revalidated.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.root = settings.STATIC_ROOT
+        self.prefix = "/" + settings.STATIC_URL.lstrip("/")
+        self._hashed = None
+
+    @property
+    def hashed(self):
+        """ the hashed names from the manifest collectstatic wrote, read once """
+        if self._hashed is None:
+            try:
+                with open(os.path.join(self.root, "staticfiles.json")) as file:
+                    self._hashed = set(json.load(file)["paths"].values())
+            except (OSError, ValueError, KeyError):
+                self._hashed = set()
+        return self._hashed
+
+    def __call__(self, request):
+        path = request.path_info
+        if self.root and request.method in ("GET", "HEAD") and path.startswith(self.prefix):
+            response = self.serve(request, path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        cache_control = IMMUTABLE if name in self.hashed else REVALIDATE
+        if not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"), stat.st_mtime):
+            # caches refresh their copy's headers from a 304, so it repeats them
+            response = HttpResponseNotModified()
+            response["Vary"] = "Accept-Encoding"
+            response["Cache-Control"] = cache_control
+            return response
+
+        content_type, _ = mimetypes.guess_type(path)
+        encoding = None
+        accepted = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        for candidate, extension in ENCODINGS:
+            if candidate in accepted and os.path.isfile(path + extension):
+                encoding, path = candidate, path + extension
+                break
+
+        response = FileResponse(open(path, "rb"), content_type=content_type or "application/octet-stream")
+        response["Last-Modified"] = http_date(stat.st_mtime)
+        response["Vary"] = "Accept-Encoding"
+        response["Cache-Control"] = cache_control
+        if encoding:
+            response["Content-Encoding"] = encoding
+        return response
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Location, Upload, Comment, Link
+from .models import Location, Upload, Comment, Link, LinkPreview
 
 # Register your models here.
 
@@ -8,3 +8,4 @@ admin.site.register(Location)
 admin.site.register(Upload)
 admin.site.register(Comment)
 admin.site.register(Link)
+admin.site.register(LinkPreview)
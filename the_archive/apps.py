@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TheArchiveConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "the_archive"
+
+    def ready(self):
+        from . import signals  # noqa: F401
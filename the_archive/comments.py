@@ -0,0 +1,78 @@
+"""
+Comment threads of an upload, one page at a time.
+
+Pages are cut with keyset pagination on (date_posted, id), which the
+comment_thread index on (upload, date_posted, id) answers directly, so a page
+deep into a long thread costs the same as the first one. Authors and their
+profiles are joined into the page query instead of being loaded per comment.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+from users.avatars import avatar_urls
+
+from .models import Comment
+
+
+def encode_cursor(comment):
+    value = f"{comment.date_posted.isoformat()}|{comment.pk}"
+    return urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """ returns (date_posted, id), or None for a missing or broken cursor """
+    try:
+        date_posted, pk = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(date_posted), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def thread_comments(upload):
+    return Comment.objects.filter(upload=upload).select_related("author", "author__profile")
+
+
+def older_page(upload, before=None, size=None):
+    """
+    the newest comments before the cursor, oldest first for display.
+    Returns (comments, cursor of the next older page or None).
+    """
+    size = size or settings.COMMENTS_PER_PAGE
+    comments = thread_comments(upload).order_by("-date_posted", "-pk")
+    position = decode_cursor(before) if before else None
+    if position:
+        date_posted, pk = position
+        comments = comments.filter(
+            Q(date_posted__lt=date_posted) | Q(date_posted=date_posted, pk__lt=pk)
+        )
+    page = list(comments[: size + 1])
+    cursor = encode_cursor(page[size - 1]) if len(page) > size else None
+    return page[:size][::-1], cursor
+
+
+def newer_page(upload, after, size=None):
+    """
+    the comments posted after the cursor, oldest first, for live refresh.
+    Returns (comments, whether more are waiting).
+    """
+    size = size or settings.COMMENTS_PER_PAGE
+    comments = thread_comments(upload).order_by("date_posted", "pk")
+    position = decode_cursor(after)
+    if position:
+        date_posted, pk = position
+        comments = comments.filter(
+            Q(date_posted__gt=date_posted) | Q(date_posted=date_posted, pk__gt=pk)
+        )
+    page = list(comments[: size + 1])
+    return page[:size], len(page) > size
+
+
+def avatar_url(user, size=32):
+    profile = getattr(user, "profile", None) if user else None
+    if not profile or not profile.image:
+        return None
+    urls = avatar_urls(profile, size)
+    return urls["webp"] if urls else profile.image.url
@@ -0,0 +1,346 @@
+"""
+Extracts plain text and a page count from uploaded documents, outside of any request.
+
+Every extractor is a generator that yields the text of one page at a time and
+reads its file as a stream, keeping at most max_chars of a page, so large files
+are never loaded into memory at once.
+Files are extracted in a bounded pool of child processes; a child that runs past
+settings.EXTRACTION_TIMEOUT is killed and one that allocates more than
+settings.EXTRACTION_MEMORY_LIMIT fails, without taking the worker down with it.
+Results are saved to UploadText as soon as each file is done, so a restarted
+worker picks up where the last one stopped.
+Run it with `python manage.py extract_texts`.
+"""
+from datetime import timedelta
+from html.parser import HTMLParser
+from multiprocessing.connection import wait
+import codecs
+import mimetypes
+import multiprocessing
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Upload, UploadText
+
+
+CHUNK_SIZE = 64 * 1024
+
+DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+PPTX = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+ODT = "application/vnd.oasis.opendocument.text"
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+TEXT = "{urn:oasis:names:tc:opendocument:xmlns:text:1.0}"
+
+
+class Page:
+    """ the text of one page, anything past max_chars is dropped as it comes in """
+
+    def __init__(self, max_chars, separator=""):
+        self.max_chars = max_chars
+        self.separator = separator
+        self.parts = []
+        self.size = 0
+
+    @property
+    def full(self):
+        return self.size >= self.max_chars
+
+    def add(self, text):
+        if self.full:
+            return
+        if self.parts:
+            text = self.separator + text
+        self.parts.append(text[: self.max_chars - self.size])
+        self.size += len(self.parts[-1])
+
+    def text(self):
+        return "".join(self.parts)
+
+
+def text_pages(path, max_chars):
+    """ plain text, pages are separated by form feeds """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    page = Page(max_chars)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            *done, rest = decoder.decode(chunk).split("\f")
+            for part in done:
+                page.add(part)
+                yield page.text()
+                page = Page(max_chars)
+            page.add(rest)
+    page.add(decoder.decode(b"", final=True))
+    yield page.text()
+
+
+class TextParser(HTMLParser):
+    SKIP = {"script", "style", "head"}
+
+    def __init__(self, max_chars):
+        super().__init__()
+        self.page = Page(max_chars, "\n")
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self.skipping += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self.skipping:
+            self.skipping -= 1
+
+    def handle_data(self, data):
+        if not self.skipping and data.strip():
+            self.page.add(data.strip())
+
+
+def html_pages(path, max_chars):
+    """ html is a single page, but it is still parsed chunk by chunk """
+    parser = TextParser(max_chars)
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), ""):
+            parser.feed(chunk)
+            if parser.page.full:
+                # a single page, nothing after this point is kept
+                break
+    parser.close()
+    yield parser.page.text()
+
+
+def pdf_pages(path, max_chars):
+    # imported on first use, most processes never extract a pdf
+    from pypdf import PdfReader
+
+    with open(path, "rb") as file:
+        for page in PdfReader(file).pages:
+            yield (page.extract_text() or "")[:max_chars]
+
+
+def iter_xml_text(stream, max_chars, paragraph, text_tag=None, page_break=None):
+    """
+    streams the text out of an office xml part paragraph by paragraph,
+    yields a page whenever page_break(element) is true and once at the end
+    """
+    page = Page(max_chars, "\n")
+    for _, element in ET.iterparse(stream):
+        if element.tag == paragraph:
+            if text_tag:
+                page.add("".join(node.text or "" for node in element.iter(text_tag)))
+            else:
+                page.add("".join(element.itertext()))
+            element.clear()
+        elif page_break and page_break(element):
+            yield page.text()
+            page = Page(max_chars, "\n")
+    yield page.text()
+
+
+def docx_pages(path, max_chars):
+    def is_page_break(element):
+        return element.tag == f"{W}br" and element.get(f"{W}type") == "page"
+
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as stream:
+        yield from iter_xml_text(stream, max_chars, f"{W}p", f"{W}t", is_page_break)
+
+
+def pptx_pages(path, max_chars):
+    """ every slide is a page """
+    with zipfile.ZipFile(path) as archive:
+        slides = sorted(
+            (name for name in archive.namelist() if name.startswith("ppt/slides/slide")),
+            key=lambda name: int("".join(filter(str.isdigit, name)) or 0),
+        )
+        for name in slides:
+            with archive.open(name) as stream:
+                yield "".join(iter_xml_text(stream, max_chars, f"{A}p", f"{A}t"))[:max_chars]
+
+
+def odt_pages(path, max_chars):
+    with zipfile.ZipFile(path) as archive, archive.open("content.xml") as stream:
+        yield from iter_xml_text(stream, max_chars, f"{TEXT}p")
+
+
+EXTRACTORS = {
+    "text/plain": text_pages,
+    "text/csv": text_pages,
+    "text/markdown": text_pages,
+    "text/html": html_pages,
+    "application/pdf": pdf_pages,
+    DOCX: docx_pages,
+    PPTX: pptx_pages,
+    ODT: odt_pages,
+}
+
+
+def content_type(path):
+    mime, _ = mimetypes.guess_type(path)
+    if mime in EXTRACTORS:
+        return mime
+    # no telling extension, sniff the first bytes. magic is only imported here
+    import magic
+
+    with open(path, "rb") as file:
+        return magic.from_buffer(file.read(4096), mime=True)
+
+
+def extract(path, max_chars):
+    """ returns (page_count, text), the text is cut off after max_chars """
+    mime = content_type(path)
+    if mime not in EXTRACTORS:
+        raise ValueError(f"no text extractor for {mime}")
+
+    pages, text, size = 0, [], 0
+    for page in EXTRACTORS[mime](path, max_chars):
+        pages += 1
+        if size < max_chars:
+            text.append(page[: max_chars - size])
+            size += len(text[-1])
+    return pages, "\f".join(text)
+
+
+def _run_child(func, args, memory_limit, conn):
+    if memory_limit:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    try:
+        conn.send((True, func(*args)))
+    except BaseException as exc:
+        conn.send((False, f"{type(exc).__name__}: {exc}"))
+    finally:
+        conn.close()
+
+
+def run_pool(func, jobs, workers, timeout, memory_limit=None):
+    """
+    runs func(*args) for every (key, args) in jobs, each in its own process with
+    at most `workers` at a time. Yields (key, ok, result or error message) as
+    soon as each job is done, killed after `timeout` seconds or crashed.
+    """
+    jobs = iter(jobs)
+    running = {}  # connection -> (key, process, deadline)
+
+    def start_next():
+        for key, args in jobs:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_run_child, args=(func, args, memory_limit, sender), daemon=True
+            )
+            process.start()
+            sender.close()
+            running[receiver] = (key, process, time.monotonic() + timeout)
+            return True
+        return False
+
+    while len(running) < workers and start_next():
+        pass
+
+    while running:
+        next_deadline = min(deadline for _, _, deadline in running.values())
+        ready = wait(list(running), timeout=max(0, next_deadline - time.monotonic()))
+        now = time.monotonic()
+        for conn in list(running):
+            key, process, deadline = running[conn]
+            if conn in ready:
+                try:
+                    ok, result = conn.recv()
+                except EOFError:
+                    process.join()
+                    ok, result = False, f"worker died with exit code {process.exitcode}"
+            elif now >= deadline:
+                process.kill()
+                ok, result = False, f"timed out after {timeout}s"
+            else:
+                continue
+            del running[conn]
+            conn.close()
+            process.join()
+            yield key, ok, result
+            start_next()
+
+
+def queue_documents():
+    """ creates a pending UploadText for every document upload that has none """
+    missing = (
+        Upload.objects.filter(media_type="document", extracted__isnull=True)
+        .exclude(file__isnull=True)
+        .exclude(file="")
+    )
+    UploadText.objects.bulk_create(
+        [UploadText(upload_id=pk) for pk in missing.values_list("pk", flat=True)],
+        ignore_conflicts=True,
+    )
+
+
+def claim_next():
+    """
+    marks the oldest pending row as running and returns it, or None if there is none.
+    Rows locked by another worker's claim are skipped, so no row is claimed twice.
+    """
+    with transaction.atomic():
+        row = (
+            UploadText.objects.select_for_update(skip_locked=True)
+            .filter(status=UploadText.PENDING)
+            .order_by("pk")
+            .first()
+        )
+        if row is None:
+            return None
+        row.status, row.started_at = UploadText.RUNNING, timezone.now()
+        row.save(update_fields=["status", "started_at"])
+    return row
+
+
+def extract_uploads(limit=100):
+    """ extracts pending documents, returns how many were processed """
+    queue_documents()
+    # rows left running by a worker that was stopped or crashed
+    UploadText.objects.filter(
+        status=UploadText.RUNNING,
+        started_at__lt=timezone.now() - timedelta(seconds=2 * settings.EXTRACTION_TIMEOUT),
+    ).update(status=UploadText.PENDING)
+
+    rows_by_pk = {}
+
+    def jobs():
+        # rows are claimed one at a time as the pool starts them, so started_at
+        # is when extraction began, not when a long batch was picked up
+        while len(rows_by_pk) < limit:
+            row = claim_next()
+            if row is None:
+                return
+            rows_by_pk[row.pk] = row
+            try:
+                path = row.upload.file.path
+            except (ValueError, NotImplementedError) as exc:
+                # the file is gone or not on the local disk, retrying won't help
+                row.status, row.error = UploadText.FAILED, f"{type(exc).__name__}: {exc}"
+                row.save(update_fields=["status", "error"])
+                continue
+            yield row.pk, (path, settings.EXTRACTION_MAX_CHARS)
+
+    for pk, ok, result in run_pool(
+        extract,
+        jobs(),
+        workers=settings.EXTRACTION_WORKERS,
+        timeout=settings.EXTRACTION_TIMEOUT,
+        memory_limit=settings.EXTRACTION_MEMORY_LIMIT,
+    ):
+        row = rows_by_pk[pk]
+        row.attempts += 1
+        if ok:
+            row.page_count, row.text = result
+            row.status, row.error = UploadText.DONE, None
+        else:
+            row.error = result
+            retry = row.attempts < settings.EXTRACTION_MAX_ATTEMPTS
+            row.status = UploadText.PENDING if retry else UploadText.FAILED
+        row.save(update_fields=["page_count", "text", "status", "error", "attempts"])
+    return len(rows_by_pk)
@@ -1,5 +1,5 @@
 from django import forms
-from .models import Upload
+from .models import Upload, Comment
 
 class UploadForm(forms.ModelForm):
 
@@ -8,3 +8,8 @@ class UploadForm(forms.ModelForm):
         fields = ['author', 'title', 'caption', 'location', 'media_type', 'file']
 
 
+class CommentForm(forms.ModelForm):
+
+    class Meta:
+        model = Comment
+        fields = ['content']
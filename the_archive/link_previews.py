@@ -0,0 +1,285 @@
+"""
+Fetches title, description and favicon for Links, outside of any request.
+
+Links are normalized and deduplicated into LinkPreview rows, so a popular url
+is fetched once no matter how many Links point to it. Fetching runs concurrently
+with asyncio, limited per host, and every fetch has a timeout. Urls resolving to
+loopback, private or link-local addresses are never fetched. Results are kept
+for settings.LINK_PREVIEW_TTL, failures are retried with exponential backoff.
+Run it with `python manage.py enrich_links`.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from html.parser import HTMLParser
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+from urllib.request import HTTPHandler, HTTPSHandler, Request, build_opener
+import asyncio
+import ipaddress
+import socket
+import time
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Link, LinkPreview
+
+
+# only the head of a page is needed, don't download whole videos or pdfs
+MAX_BYTES = 256 * 1024
+CHUNK_SIZE = 16 * 1024
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url):
+    """
+    lowercases scheme and host, drops default ports, fragments and tracking parameters.
+    Raises ValueError for a url with an invalid port.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        # ipv6 addresses keep their brackets
+        host = f"[{host}]"
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.startswith("utm_")
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+class MetadataParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.title = None
+        self.description = None
+        self.favicon = None
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "title" and self.title is None:
+            self._in_title = True
+            self.title = ""
+        elif tag == "meta":
+            name = (attrs.get("name") or attrs.get("property") or "").lower()
+            if name in ("description", "og:description") and not self.description:
+                self.description = attrs.get("content")
+            elif name == "og:title" and not self.title:
+                self.title = attrs.get("content")
+        elif tag == "link" and "icon" in (attrs.get("rel") or "").lower().split():
+            self.favicon = self.favicon or attrs.get("href")
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+
+
+def parse_metadata(html, base_url):
+    parser = MetadataParser()
+    parser.feed(html)
+    return {
+        "title": (parser.title or "").strip()[:300] or None,
+        "description": (parser.description or "").strip() or None,
+        "favicon": urljoin(base_url, parser.favicon or "/favicon.ico"),
+    }
+
+
+def public_addresses(host, port):
+    """ the getaddrinfo entries of host, raises ValueError if any of them isn't public """
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as error:
+        raise ValueError(f"can't resolve {host}") from error
+    for *_, sockaddr in infos:
+        ip = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        ip = getattr(ip, "ipv4_mapped", None) or ip
+        if not ip.is_global:
+            raise ValueError(f"{host} resolves to the non public address {ip}")
+    return infos
+
+
+def connect_public(host, port, timeout):
+    """
+    connects to one of the checked addresses of host. Connecting by name would
+    resolve it a second time, and a rebinding dns server could answer differently.
+    """
+    error = None
+    for family, kind, proto, _, sockaddr in public_addresses(host, port):
+        sock = socket.socket(family, kind, proto)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(sockaddr)
+            return sock
+        except OSError as exc:
+            sock.close()
+            error = exc
+    raise error or OSError(f"can't connect to {host}")
+
+
+class PublicHTTPConnection(HTTPConnection):
+    def connect(self):
+        self.sock = connect_public(self.host, self.port, self.timeout)
+
+
+class PublicHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        sock = connect_public(self.host, self.port, self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+class PublicHTTPHandler(HTTPHandler):
+    """ every connection, redirects included, only goes to public addresses """
+
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+def download(url, timeout, allow_private=False):
+    """
+    fetches the metadata of url. The socket timeout only applies to single
+    reads, so the whole download also has to finish within `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    opener = build_opener() if allow_private else build_opener(PublicHTTPHandler, PublicHTTPSHandler)
+
+    request = Request(url, headers={"User-Agent": "civic-platform link preview"})
+    with opener.open(request, timeout=timeout) as response:
+        charset = response.headers.get_content_charset() or "utf-8"
+        chunks, size = [], 0
+        while size < MAX_BYTES:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{url} took longer than {timeout}s")
+            chunk = response.read(min(CHUNK_SIZE, MAX_BYTES - size))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        html = b"".join(chunks).decode(charset, errors="replace")
+        return parse_metadata(html, response.geturl())
+
+
+async def fetch_all(urls, per_host=2, timeout=5.0, workers=16, allow_private=False):
+    """
+    returns {url: metadata dict or the exception that fetching raised},
+    with at most `per_host` requests running against the same host
+    """
+    loop = asyncio.get_running_loop()
+    hosts = {}
+
+    async def fetch(url, executor):
+        semaphore = hosts.setdefault(urlsplit(url).netloc, asyncio.Semaphore(per_host))
+        async with semaphore:
+            future = loop.run_in_executor(executor, download, url, timeout, allow_private)
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                # a thread can't be cancelled, it keeps its slot on the host until it returns
+                await asyncio.wait([future])
+                # its late error is of no interest, but has to be retrieved to not be logged
+                if not future.cancelled():
+                    future.exception()
+                raise
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        results = await asyncio.gather(
+            *(fetch(url, executor) for url in urls), return_exceptions=True
+        )
+    finally:
+        # every download has returned by now, unless fetch_all itself was
+        # cancelled, and then the loop shouldn't block on them either
+        executor.shutdown(wait=False)
+    return dict(zip(urls, results))
+
+
+def attach_previews():
+    """ points every Link without a preview to the LinkPreview of its normalized url """
+    links = list(
+        Link.objects.filter(preview__isnull=True).exclude(url__isnull=True).exclude(url="")
+    )
+    if not links:
+        return 0
+
+    urls = {}
+    for link in links:
+        try:
+            urls[link.pk] = normalize_url(link.url)
+        except ValueError:
+            # a broken url gets no preview, but doesn't hold up the others
+            continue
+    links = [link for link in links if link.pk in urls]
+    if not links:
+        return 0
+
+    LinkPreview.objects.bulk_create(
+        [LinkPreview(url=url) for url in set(urls.values())], ignore_conflicts=True
+    )
+    previews = dict(
+        LinkPreview.objects.filter(url__in=set(urls.values())).values_list("url", "pk")
+    )
+    for link in links:
+        link.preview_id = previews[urls[link.pk]]
+    Link.objects.bulk_update(links, ["preview"])
+    return len(links)
+
+
+def due_previews(now, limit):
+    return list(
+        LinkPreview.objects.filter(Q(expires_at__isnull=True) | Q(expires_at__lte=now))
+        .filter(Q(next_attempt__isnull=True) | Q(next_attempt__lte=now))
+        .filter(attempts__lt=settings.LINK_PREVIEW_MAX_ATTEMPTS)
+        .order_by(F("next_attempt").asc(nulls_first=True), "pk")[:limit]
+    )
+
+
+def enrich_links(limit=500):
+    """ fetches every preview that is new, expired or due for a retry, returns the count """
+    attach_previews()
+    now = timezone.now()
+    previews = due_previews(now, limit)
+    if not previews:
+        return 0
+
+    results = asyncio.run(
+        fetch_all(
+            [preview.url for preview in previews],
+            per_host=settings.LINK_PREVIEW_PER_HOST,
+            timeout=settings.LINK_PREVIEW_TIMEOUT,
+        )
+    )
+    for preview in previews:
+        result = results[preview.url]
+        if isinstance(result, Exception):
+            # keep whatever was fetched before, an expired preview beats none
+            preview.attempts += 1
+            backoff = settings.LINK_PREVIEW_RETRY_BACKOFF * 2 ** (preview.attempts - 1)
+            preview.next_attempt = now + timedelta(seconds=backoff)
+            continue
+        preview.title = result["title"]
+        preview.description = result["description"]
+        preview.favicon = result["favicon"]
+        preview.fetched_at = now
+        preview.expires_at = now + timedelta(seconds=settings.LINK_PREVIEW_TTL)
+        preview.attempts = 0
+        preview.next_attempt = None
+
+    LinkPreview.objects.bulk_update(
+        previews,
+        ["title", "description", "favicon", "fetched_at", "expires_at", "attempts", "next_attempt"],
+    )
+    return len(previews)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from the_archive.related import build_related
+
+
+class Command(BaseCommand):
+    """ Django command to precompute the related uploads of changed uploads"""
+    help = "Refreshes related uploads of uploads whose tags changed, or of all with --full."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="rebuild every upload")
+
+    def handle(self, *args, **kwargs):
+        refreshed = build_related(full=kwargs["full"])
+        self.stdout.write(self.style.SUCCESS(f"refreshed related uploads of {refreshed} uploads"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+import time
+
+from the_archive.link_previews import enrich_links
+
+
+class Command(BaseCommand):
+    """ Django command to fetch link previews, once or in a loop as a worker"""
+    help = "Fetches title, description and favicon for new, expired and failed link previews."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=500, help="previews to fetch per run")
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="keep running and fetch every INTERVAL seconds",
+        )
+
+    def handle(self, *args, **kwargs):
+        while True:
+            fetched = enrich_links(limit=kwargs["limit"])
+            self.stdout.write(f"fetched {fetched} link previews")
+            if not kwargs["interval"]:
+                break
+            time.sleep(kwargs["interval"])
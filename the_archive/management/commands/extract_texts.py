@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+import time
+
+from the_archive.extraction import extract_uploads
+
+
+class Command(BaseCommand):
+    """ Django command to extract the text of document uploads, once or in a loop as a worker"""
+    help = "Extracts plain text and page counts from pending document uploads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=100, help="documents to extract per run")
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="keep running and extract every INTERVAL seconds",
+        )
+
+    def handle(self, *args, **kwargs):
+        while True:
+            processed = extract_uploads(limit=kwargs["limit"])
+            self.stdout.write(f"processed {processed} documents")
+            if not kwargs["interval"]:
+                break
+            time.sleep(kwargs["interval"])
@@ -0,0 +1,45 @@
+# Generated by Django 4.1.7 on 2026-10-19 16:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("the_archive", "0003_alter_upload_location_alter_upload_media_type_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LinkPreview",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("url", models.URLField(max_length=2000, unique=True)),
+                ("title", models.CharField(max_length=300, null=True)),
+                ("description", models.TextField(null=True)),
+                ("favicon", models.URLField(max_length=2000, null=True)),
+                ("fetched_at", models.DateTimeField(null=True)),
+                ("expires_at", models.DateTimeField(db_index=True, null=True)),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("next_attempt", models.DateTimeField(db_index=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="link",
+            name="preview",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="links",
+                to="the_archive.linkpreview",
+            ),
+        ),
+    ]
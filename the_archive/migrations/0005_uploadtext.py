@@ -0,0 +1,47 @@
+# Generated by Django 4.1.7 on 2026-10-19 16:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("the_archive", "0004_linkpreview_link_preview"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UploadText",
+            fields=[
+                (
+                    "upload",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="extracted",
+                        serialize=False,
+                        to="the_archive.upload",
+                    ),
+                ),
+                ("text", models.TextField(default="")),
+                ("page_count", models.PositiveIntegerField(null=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        db_index=True,
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("error", models.TextField(null=True)),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("started_at", models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
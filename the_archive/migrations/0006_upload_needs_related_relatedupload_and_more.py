@@ -0,0 +1,56 @@
+# Generated by Django 4.1.7 on 2026-10-19 16:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("the_archive", "0005_uploadtext"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="upload",
+            name="needs_related",
+            field=models.BooleanField(db_index=True, default=True),
+        ),
+        migrations.CreateModel(
+            name="RelatedUpload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField()),
+                ("rank", models.PositiveSmallIntegerField()),
+                (
+                    "related",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="related_to",
+                        to="the_archive.upload",
+                    ),
+                ),
+                (
+                    "upload",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="the_archive.upload",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="relatedupload",
+            constraint=models.UniqueConstraint(
+                fields=("upload", "rank"), name="related_upload_rank"
+            ),
+        ),
+    ]
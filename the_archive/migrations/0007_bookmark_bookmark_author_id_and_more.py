@@ -0,0 +1,36 @@
+# Generated by Django 4.1.7 on 2026-10-19 16:13
+
+from django.db import migrations, models
+
+
+def delete_duplicate_bookmarks(apps, schema_editor):
+    """ keeps the oldest bookmark of every (author, upload) pair """
+    Bookmark = apps.get_model("the_archive", "Bookmark")
+    seen = set()
+    duplicates = []
+    rows = Bookmark.objects.exclude(author=None).order_by("pk")
+    for pk, author, upload in rows.values_list("pk", "author_id", "upload_id").iterator():
+        if (author, upload) in seen:
+            duplicates.append(pk)
+        seen.add((author, upload))
+    Bookmark.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("the_archive", "0006_upload_needs_related_relatedupload_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_bookmarks, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="bookmark",
+            index=models.Index(fields=["author", "id"], name="bookmark_author_id"),
+        ),
+        migrations.AddConstraint(
+            model_name="bookmark",
+            constraint=models.UniqueConstraint(
+                fields=("author", "upload"), name="bookmark_author_upload"
+            ),
+        ),
+    ]
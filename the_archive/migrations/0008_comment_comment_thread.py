@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-19 16:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("the_archive", "0007_bookmark_bookmark_author_id_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["upload", "date_posted", "id"], name="comment_thread"
+            ),
+        ),
+    ]
@@ -17,8 +17,6 @@ from django.utils import timezone
 from django.contrib.auth.models import User
 from django.contrib.gis.db import models as gis_models
 
-import magic
-
 
 class Location(models.Model):
     city = models.CharField(max_length=200, null=True)
@@ -51,6 +49,8 @@ class Upload(models.Model):
     media_type = models.CharField(max_length=10, choices=category)
     link = models.ForeignKey("Link", null=True, on_delete=models.PROTECT)
     tags = models.ManyToManyField("Tag", related_name="uploads_tags")
+    # set when the tags change, cleared by the_archive/related.py
+    needs_related = models.BooleanField(default=True, db_index=True)
 
     def __str__(self):
         return f"{self.author}, {self.title}, {self.caption},{self.date_uploaded}, {self.file}, {self.media_type}, {self.tags}"
@@ -58,6 +58,55 @@ class Upload(models.Model):
     def comment_count(self):
         return self.comment_set.count()
 
+    def related_uploads(self):
+        """ the precomputed related uploads, best first """
+        return Upload.objects.filter(related_to__upload=self).order_by("related_to__rank")
+
+
+class RelatedUpload(models.Model):
+    """ the top related uploads of an upload, written by the_archive/related.py """
+    upload = models.ForeignKey(Upload, on_delete=models.CASCADE, related_name="+")
+    related = models.ForeignKey(Upload, on_delete=models.CASCADE, related_name="related_to")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["upload", "rank"], name="related_upload_rank")
+        ]
+
+    def __str__(self):
+        return f"{self.upload_id}, {self.related_id}, {self.score}"
+
+
+class UploadText(models.Model):
+    """ plain text extracted from a document upload by the_archive/extraction.py """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    status_choices = (
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    upload = models.OneToOneField(
+        Upload, primary_key=True, on_delete=models.CASCADE, related_name="extracted"
+    )
+    text = models.TextField(default="")
+    page_count = models.PositiveIntegerField(null=True)
+    status = models.CharField(
+        max_length=10, choices=status_choices, default=PENDING, db_index=True
+    )
+    error = models.TextField(null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    started_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"{self.upload_id}, {self.status}, {self.page_count}"
+
 
 class Comment(models.Model):
     upload = models.ForeignKey(Upload, on_delete=models.CASCADE)
@@ -66,6 +115,12 @@ class Comment(models.Model):
     date_posted = models.DateTimeField(auto_now_add=True)
     date_edited = models.DateTimeField(auto_now=True, null=True)
 
+    class Meta:
+        # keyset pagination of a thread, see the_archive/comments.py
+        indexes = [
+            models.Index(fields=["upload", "date_posted", "id"], name="comment_thread")
+        ]
+
     def __str__(self):
         return f"{self.author}, {self.content}, {self.date_posted},{self.date_edited}"
 
@@ -76,6 +131,13 @@ class Bookmark(models.Model):
     tags = models.ManyToManyField("Tag")
     link = models.ForeignKey("Link", null=True, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["author", "upload"], name="bookmark_author_upload")
+        ]
+        # newest first feed of a user, see the_archive/bookmarks.py
+        indexes = [models.Index(fields=["author", "id"], name="bookmark_author_id")]
+
     def __str__(self):
         return f"{self.author}, {self.content}, {self.date_posted},{self.date_edited}"
 
@@ -90,3 +152,21 @@ class Tag(models.Model):
 class Link(models.Model):
     url = models.URLField(null=True)
     description = models.CharField(max_length=255)
+    preview = models.ForeignKey(
+        "LinkPreview", null=True, on_delete=models.SET_NULL, related_name="links"
+    )
+
+
+class LinkPreview(models.Model):
+    """ metadata of a normalized url, shared by every Link pointing to it """
+    url = models.URLField(max_length=2000, unique=True)
+    title = models.CharField(max_length=300, null=True)
+    description = models.TextField(null=True)
+    favicon = models.URLField(max_length=2000, null=True)
+    fetched_at = models.DateTimeField(null=True)
+    expires_at = models.DateTimeField(null=True, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(null=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.url}, {self.title}"
@@ -0,0 +1,192 @@
+"""
+Precomputes the "related uploads" of every upload into RelatedUpload.
+
+Two uploads are related when they share tags, weighted by TF-IDF so rare tags
+count more than common ones, and when they were made close to each other.
+Upload.location is a city name, its coordinates come from the Location with
+the same city. Serving is a single lookup, see Upload.related_uploads().
+
+Uploads whose tags changed are flagged with needs_related (see signals.py) and
+refreshed together with every upload their change can reorder: the ones that
+list them, share a tag with them or lie within the radius. `--full` rebuilds
+all of them.
+Run it with `python manage.py build_related`.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from .models import Location, RelatedUpload, Upload
+
+
+EARTH_RADIUS_KM = 6371.0
+BATCH_SIZE = 500
+
+
+def unit_vectors(coords):
+    """ (lon, lat) in degrees to points on the unit sphere """
+    import numpy as np
+
+    lon, lat = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def compute_related(ids, pairs, coords, targets, k, radius_km, geo_weight, changed=()):
+    """
+    ids:     sorted upload ids
+    pairs:   (upload_id, tag_id) rows of the tags m2m table
+    coords:  (lon, lat) per id, nan when unknown
+    targets: the upload ids to compute neighbours for
+    changed: upload ids whose tags changed, every upload with a non zero score
+             against one of them is added to the targets
+    returns {upload_id: [(related_id, score), ...]} with the best k first
+    """
+    # imported here, they are only needed by this batch job
+    import numpy as np
+    from scipy import sparse
+    from scipy.spatial import cKDTree
+
+    ids = np.asarray(ids, dtype=np.int64)
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    n = len(ids)
+    # uploads created after ids was read are left for the next run
+    pairs = pairs[np.isin(pairs[:, 0], ids)]
+    targets = np.intersect1d(np.asarray(targets, dtype=np.int64), ids)
+    changed = np.intersect1d(np.asarray(changed, dtype=np.int64), ids)
+
+    rows = np.searchsorted(ids, pairs[:, 0])
+    tags, cols = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, cols)), shape=(n, len(tags)), dtype=np.float64
+    )
+    idf = np.log(n / np.maximum(np.bincount(cols, minlength=len(tags)), 1))
+    matrix = matrix @ sparse.diags(idf)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    matrix = sparse.diags(np.divide(1, norms, out=np.zeros(n), where=norms > 0)) @ matrix
+    matrix = matrix.tocsr()
+    # tags on every upload have an idf of 0, they relate nothing
+    matrix.eliminate_zeros()
+
+    known = ~np.isnan(coords).any(axis=1)
+    located = np.flatnonzero(known)
+    tree = cKDTree(unit_vectors(coords[located])) if len(located) else None
+    max_chord = 2 * np.sin(radius_km / EARTH_RADIUS_KM / 2)
+
+    target_rows = np.searchsorted(ids, targets)
+    if len(changed):
+        changed_rows = np.searchsorted(ids, changed)
+        # uploads sharing a weighted tag with a changed upload
+        shared = np.flatnonzero(np.asarray(matrix[changed_rows].sum(axis=0)).ravel())
+        affected = [np.flatnonzero(matrix[:, shared].getnnz(axis=1)), changed_rows]
+        # and the ones close enough to get a geo score
+        changed_located = changed_rows[known[changed_rows]]
+        if tree is not None and len(changed_located):
+            for hits in tree.query_ball_point(unit_vectors(coords[changed_located]), max_chord):
+                affected.append(located[np.asarray(hits, dtype=np.int64)])
+        target_rows = np.union1d(target_rows, np.concatenate(affected)).astype(np.int64)
+
+    related = {}
+    for start in range(0, len(target_rows), BATCH_SIZE):
+        batch = target_rows[start:start + BATCH_SIZE]
+        similarity = (matrix[batch] @ matrix.T).tocsr()
+        for offset, row in enumerate(batch):
+            line = similarity.getrow(offset)
+            scores = dict(zip(line.indices, line.data))
+
+            if tree is not None and known[row]:
+                distances, hits = tree.query(
+                    unit_vectors(coords[row:row + 1])[0],
+                    k=min(k + 1, len(located)),
+                    distance_upper_bound=max_chord,
+                )
+                for chord, hit in zip(np.atleast_1d(distances), np.atleast_1d(hits)):
+                    if np.isinf(chord):
+                        continue
+                    km = 2 * EARTH_RADIUS_KM * np.arcsin(min(chord / 2, 1))
+                    other = located[hit]
+                    scores[other] = scores.get(other, 0) + geo_weight * (1 - km / radius_km)
+
+            scores.pop(row, None)
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            related[int(ids[row])] = [(int(ids[other]), float(score)) for other, score in best if score > 0]
+    return related
+
+
+def upload_coordinates(ids):
+    """ (lon, lat) of every upload through the Location of the same city, nan if there is none """
+    import numpy as np
+
+    cities = {
+        city.strip().lower(): (point.x, point.y)
+        for city, point in Location.objects.exclude(coordinates=None)
+        .exclude(city=None)
+        .values_list("city", "coordinates")
+    }
+    locations = dict(Upload.objects.exclude(location=None).values_list("pk", "location"))
+    coords = np.full((len(ids), 2), np.nan)
+    for row, pk in enumerate(ids):
+        city = (locations.get(pk) or "").strip().lower()
+        if city in cities:
+            coords[row] = cities[city]
+    return coords
+
+
+def claim_flagged():
+    """
+    clears needs_related and returns the uploads it was set on. Clearing it
+    before the run means a flag set while the run is busy survives for the next one.
+    """
+    with transaction.atomic():
+        flagged = list(
+            Upload.objects.select_for_update()
+            .filter(needs_related=True)
+            .values_list("pk", flat=True)
+        )
+        Upload.objects.filter(pk__in=flagged).update(needs_related=False)
+    return flagged
+
+
+def build_related(full=False):
+    """ refreshes the related uploads of flagged uploads, or of all with full=True """
+    flagged = claim_flagged()
+    # read after the claim, so every claimed upload is in it
+    ids = list(Upload.objects.order_by("pk").values_list("pk", flat=True))
+    if not ids:
+        return 0
+    if full:
+        targets, changed = ids, []
+    else:
+        if not flagged:
+            return 0
+        # uploads that list a changed upload may rank it differently now,
+        # even when they no longer share a tag with it
+        listing = RelatedUpload.objects.filter(related__in=flagged).values_list("upload_id", flat=True)
+        targets, changed = sorted(set(flagged) | set(listing)), flagged
+
+    try:
+        pairs = list(Upload.tags.through.objects.values_list("upload_id", "tag_id"))
+        related = compute_related(
+            ids,
+            pairs,
+            upload_coordinates(ids),
+            targets,
+            k=settings.RELATED_UPLOADS_K,
+            radius_km=settings.RELATED_GEO_RADIUS_KM,
+            geo_weight=settings.RELATED_GEO_WEIGHT,
+            changed=changed,
+        )
+
+        with transaction.atomic():
+            RelatedUpload.objects.filter(upload__in=list(related)).delete()
+            RelatedUpload.objects.bulk_create(
+                [
+                    RelatedUpload(upload_id=pk, related_id=other, score=score, rank=rank)
+                    for pk, neighbours in related.items()
+                    for rank, (other, score) in enumerate(neighbours)
+                ],
+                batch_size=1000,
+            )
+    except BaseException:
+        # hand the claimed flags back, the next run has to redo them
+        Upload.objects.filter(pk__in=flagged).update(needs_related=True)
+        raise
+    return len(related)
@@ -0,0 +1,31 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import bookmarks
+from .models import Bookmark, Upload
+
+
+@receiver(m2m_changed, sender=Upload.tags.through)
+def flag_related(sender, instance, action, reverse, pk_set, **kwargs):
+    """ flags uploads whose tags changed, so build_related refreshes them """
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        Upload.objects.filter(pk=instance.pk).update(needs_related=True)
+    elif action == "pre_clear":
+        instance.uploads_tags.update(needs_related=True)
+    else:
+        Upload.objects.filter(pk__in=pk_set).update(needs_related=True)
+
+
+@receiver(post_save, sender=Bookmark)
+@receiver(post_delete, sender=Bookmark)
+def invalidate_bookmarks(sender, instance, **kwargs):
+    """
+    drops the cached bookmark set of the author once the change is committed,
+    dropping it earlier lets a concurrent request cache the old set again
+    """
+    if instance.author_id:
+        author_id = instance.author_id
+        transaction.on_commit(lambda: bookmarks.invalidate(author_id))
@@ -1,3 +1,484 @@
-from django.test import TestCase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import zipfile
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.test import SimpleTestCase, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from civic_platform.staticfiles import StaticFilesMiddleware, compress_file
+
+from .bookmarks import bookmark_page, bookmarked_ids, cache_key, is_bookmarked
+from .comments import decode_cursor, encode_cursor
+from .extraction import extract, html_pages, run_pool, text_pages
+from .link_previews import fetch_all, normalize_url, public_addresses
+from .models import Bookmark, Comment, Upload
+from .related import compute_related
+from .throttling import TokenBucket, ThrottleMiddleware, throttle
+
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    THROTTLE_RATES={
+        "test": {"ip": "2/minute"},
+        "media": {"ip": "3/minute", "media_type": {"video": "1/minute"}},
+    },
+)
+class ThrottleTest(SimpleTestCase):
+    def setUp(self):
+        caches["shared"].clear()
+
+    def test_bucket_refills_over_time(self):
+        bucket = TokenBucket("refill", "2/minute")
+        self.assertEqual(bucket.consume(now=0), 0)
+        self.assertEqual(bucket.consume(now=0), 0)
+        self.assertEqual(bucket.consume(now=0), 30)
+        self.assertEqual(bucket.consume(now=30), 0)
+
+    def test_middleware_rejects_before_view(self):
+        @throttle("test")
+        def view(request):
+            return HttpResponse()
+
+        middleware = ThrottleMiddleware(lambda request: HttpResponse())
+        factory = RequestFactory()
+        responses = []
+        for _ in range(3):
+            request = factory.post("/", REMOTE_ADDR="10.0.0.1")
+            request.user = AnonymousUser()
+            responses.append(middleware.process_view(request, view, (), {}))
+
+        self.assertIsNone(responses[0])
+        self.assertIsNone(responses[1])
+        self.assertEqual(responses[2].status_code, 429)
+        self.assertEqual(responses[2]["Retry-After"], "30")
+        # a rejected request never reached the view, so its body was never read
+        self.assertFalse(hasattr(request, "_post"))
+
+    def post(self, view, path):
+        request = RequestFactory().post(path, REMOTE_ADDR="10.0.0.1")
+        request.user = AnonymousUser()
+        return ThrottleMiddleware(lambda request: HttpResponse()).process_view(request, view, (), {})
+
+    def test_media_type_limit_comes_from_the_url(self):
+        view = throttle("media")(lambda request: HttpResponse())
+
+        self.assertIsNone(self.post(view, "/?media_type=video"))
+        self.assertEqual(self.post(view, "/?media_type=video").status_code, 429)
+        self.assertIsNone(self.post(view, "/?media_type=image"))
+
+    def test_rejected_requests_take_no_tokens(self):
+        view = throttle("media")(lambda request: HttpResponse())
+
+        self.post(view, "/?media_type=video")
+        for _ in range(5):
+            self.assertEqual(self.post(view, "/?media_type=video").status_code, 429)
+        # the refused videos left the ip bucket alone
+        self.assertIsNone(self.post(view, "/?media_type=image"))
+        self.assertIsNone(self.post(view, "/?media_type=image"))
+        self.assertEqual(self.post(view, "/?media_type=image").status_code, 429)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class UploadMediaTypeTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        media = override_settings(MEDIA_ROOT=self.tmp.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def upload(self, media_type, query=""):
+        data = {
+            "title": "Town hall",
+            "media_type": media_type,
+            "file": SimpleUploadedFile("minutes.txt", b"minutes"),
+        }
+        return self.client.post(reverse("the_archive-upload") + query, data)
+
+    def test_unlimited_types_need_no_query(self):
+        self.assertEqual(self.upload("document").status_code, 302)
+
+    def test_limited_types_must_be_declared_in_the_url(self):
+        response = self.upload("video")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("media_type", response.context["form"].errors)
+        self.assertEqual(self.upload("video", "?media_type=video").status_code, 302)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """ serves a page with metadata on /page, sleeps on /slow and counts concurrent requests """
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            StubHandler.active += 1
+            StubHandler.peak = max(StubHandler.peak, StubHandler.active)
+        try:
+            time.sleep(2 if self.path == "/slow" else 0.05)
+            body = (
+                b"<html><head><title> Town hall </title>"
+                b'<meta name="description" content="Minutes of the meeting">'
+                b'<link rel="shortcut icon" href="/static/icon.png"></head></html>'
+            )
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with self.lock:
+                StubHandler.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class LinkPreviewTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_normalize_url(self):
+        self.assertEqual(
+            normalize_url("HTTPS://Example.org:443?b=2&utm_source=x&a=1#top"),
+            "https://example.org/?a=1&b=2",
+        )
+        self.assertEqual(normalize_url("http://[::1]:8080/x"), "http://[::1]:8080/x")
+        with self.assertRaises(ValueError):
+            normalize_url("http://example.org:99999/")
+
+    def test_internal_addresses_are_refused(self):
+        for host in ("127.0.0.1", "10.1.2.3", "169.254.169.254", "::1", "localhost"):
+            with self.assertRaises(ValueError):
+                public_addresses(host, 80)
+        results = asyncio.run(fetch_all([f"{self.base}/page"]))
+        self.assertIsInstance(results[f"{self.base}/page"], ValueError)
+
+    def test_fetch_all_parses_metadata(self):
+        url = f"{self.base}/page"
+        results = asyncio.run(fetch_all([url], allow_private=True))
+        self.assertEqual(
+            results[url],
+            {
+                "title": "Town hall",
+                "description": "Minutes of the meeting",
+                "favicon": f"{self.base}/static/icon.png",
+            },
+        )
+
+    def test_fetch_all_limits_per_host_and_times_out(self):
+        StubHandler.peak = 0
+        urls = [f"{self.base}/page?n={n}" for n in range(6)] + [f"{self.base}/slow"]
+        results = asyncio.run(fetch_all(urls, per_host=2, timeout=0.5, allow_private=True))
+        self.assertLessEqual(StubHandler.peak, 2)
+        self.assertIsInstance(results[f"{self.base}/slow"], Exception)
+        self.assertEqual(results[urls[0]]["title"], "Town hall")
+
+    def test_timed_out_fetch_keeps_its_host_slot(self):
+        running = []
+        peak = []
+
+        def download(url, timeout, allow_private):
+            running.append(url)
+            peak.append(len(running))
+            # ignores its timeout, like a download stuck in dns resolution
+            time.sleep(1 if url.endswith("/slow") else 0)
+            running.remove(url)
+            return {"title": url}
+
+        urls = ["https://example.org/slow", "https://example.org/page"]
+        with mock.patch("the_archive.link_previews.download", download):
+            results = asyncio.run(fetch_all(urls, per_host=1, timeout=0.2))
+        # the page only started once the abandoned slow download had returned
+        self.assertEqual(max(peak), 1)
+        self.assertIsInstance(results[urls[0]], asyncio.TimeoutError)
+        self.assertEqual(results[urls[1]], {"title": urls[1]})
+
+
+class ExtractionTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_text_pages_split_on_form_feed(self):
+        with open(self.path("minutes.txt"), "w") as file:
+            file.write("first page\fsecond page\fthird")
+        self.assertEqual(
+            extract(self.path("minutes.txt"), max_chars=100),
+            (3, "first page\fsecond page\fthird"),
+        )
+
+    def test_text_is_cut_off_but_pages_are_counted(self):
+        with open(self.path("long.txt"), "w") as file:
+            file.write("a" * 50 + "\f" + "b" * 50)
+        pages, text = extract(self.path("long.txt"), max_chars=60)
+        self.assertEqual(pages, 2)
+        self.assertEqual(text, "a" * 50 + "\f" + "b" * 10)
+
+    def test_extractors_stop_collecting_at_the_cap(self):
+        # no form feed, the whole file is one page far longer than the cap
+        with open(self.path("log.csv"), "w") as file:
+            file.write("a,b\n" * 100_000 + "\flast page")
+        self.assertEqual([len(page) for page in text_pages(self.path("log.csv"), 10)], [10, 9])
+
+        with open(self.path("page.html"), "w") as file:
+            file.write("<p>town hall</p>" * 100_000)
+        self.assertEqual(list(html_pages(self.path("page.html"), 15)), ["town hall\ntown "])
+
+    def test_docx_page_breaks(self):
+        w = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+        document = (
+            f"<w:document {w}><w:body>"
+            "<w:p><w:r><w:t>Town </w:t></w:r><w:r><w:t>hall</w:t></w:r></w:p>"
+            '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+            "<w:p><w:r><w:t>Budget</w:t></w:r></w:p>"
+            "</w:body></w:document>"
+        )
+        with zipfile.ZipFile(self.path("report.docx"), "w") as archive:
+            archive.writestr("word/document.xml", document)
+        self.assertEqual(extract(self.path("report.docx"), max_chars=100), (2, "Town hall\f\nBudget"))
+
+    def test_run_pool_kills_jobs_past_the_timeout(self):
+        jobs = [("slow", (5,)), ("fast", (0,))]
+        started = time.monotonic()
+        results = {key: (ok, result) for key, ok, result in run_pool(time.sleep, jobs, 2, 0.5)}
+        self.assertLess(time.monotonic() - started, 3)
+        self.assertEqual(results["fast"], (True, None))
+        self.assertEqual(results["slow"], (False, "timed out after 0.5s"))
+
+
+class RelatedUploadsTest(SimpleTestCase):
+    def test_rare_shared_tags_and_nearby_uploads_rank_first(self):
+        import numpy as np
+
+        # tag 1 is on every upload, tag 2 only on uploads 10 and 20
+        pairs = [(10, 1), (10, 2), (20, 1), (20, 2), (30, 1), (40, 1)]
+        nan = float("nan")
+        # 10 and 40 are in Berlin and Potsdam, 30 is in Munich
+        coords = np.array([[13.40, 52.52], [nan, nan], [11.58, 48.14], [13.06, 52.39]])
+
+        related = compute_related(
+            [10, 20, 30, 40], pairs, coords, [10, 30], k=2, radius_km=50, geo_weight=0.3
+        )
+
+        self.assertEqual([pk for pk, _ in related[10]], [20, 40])
+        # tag 1 carries no weight, Munich is too far from Berlin and Potsdam
+        self.assertEqual(related[30], [])
+
+    def test_changed_uploads_pull_in_everything_they_touch(self):
+        import numpy as np
+
+        # 10 and 20 share tag 2, 30 is near 10, 40 is far away and shares nothing
+        pairs = [(10, 1), (10, 2), (20, 2), (30, 3), (40, 4)]
+        nan = float("nan")
+        coords = np.array([[13.40, 52.52], [nan, nan], [13.06, 52.39], [11.58, 48.14]])
+
+        related = compute_related(
+            [10, 20, 30, 40], pairs, coords, [], k=2, radius_km=50, geo_weight=0.3, changed=[10]
+        )
+
+        self.assertEqual(sorted(related), [10, 20, 30])
+        self.assertEqual([pk for pk, _ in related[20]], [10])
+
+    def test_uploads_newer_than_the_snapshot_are_ignored(self):
+        import numpy as np
+
+        # upload 3 was created and tagged after the ids were read
+        coords = np.full((2, 2), np.nan)
+        pairs = [(1, 1), (2, 1), (3, 1), (1, 2)]
+        related = compute_related(
+            [1, 2], pairs, coords, [1, 3], k=2, radius_km=50, geo_weight=0.3, changed=[3]
+        )
+        self.assertEqual(related, {1: []})
+
+    def test_uploads_without_tags(self):
+        import numpy as np
+
+        coords = np.full((2, 2), np.nan)
+        related = compute_related([1, 2], [], coords, [1, 2], k=5, radius_km=50, geo_weight=0.3)
+        self.assertEqual(related, {1: [], 2: []})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BookmarkTest(SimpleTestCase):
+    """ SimpleTestCase fails on any database query, so these also count queries """
+
+    def test_anonymous_users_cost_no_query(self):
+        self.assertEqual(is_bookmarked(AnonymousUser(), [1, 2, 3]), set())
+
+    def test_cached_bookmarks_cost_no_query(self):
+        class User:
+            pk = 7
+            is_authenticated = True
+
+        caches["shared"].set(cache_key(7), frozenset({2, 5}))
+        self.assertEqual(is_bookmarked(User(), [1, 2, 3]), {2})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BookmarkPageTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("reader")
+        uploads = [Upload.objects.create(title=f"upload {n}", media_type="document") for n in range(5)]
+        cls.bookmarks = [Bookmark.objects.create(author=cls.user, upload=upload) for upload in uploads]
+
+    def setUp(self):
+        caches["shared"].clear()
+
+    def test_pages_follow_the_cursor_to_the_end(self):
+        newest_first = [bookmark.pk for bookmark in reversed(self.bookmarks)]
+
+        page, cursor = bookmark_page(self.user, size=2)
+        self.assertEqual([bookmark.pk for bookmark in page], newest_first[:2])
+        self.assertEqual(cursor, newest_first[1])
+
+        page, cursor = bookmark_page(self.user, before=cursor, size=2)
+        self.assertEqual([bookmark.pk for bookmark in page], newest_first[2:4])
+
+        page, cursor = bookmark_page(self.user, before=cursor, size=2)
+        self.assertEqual([bookmark.pk for bookmark in page], newest_first[4:])
+        self.assertIsNone(cursor)
+
+    def test_page_of_exactly_size_is_the_last(self):
+        page, cursor = bookmark_page(self.user, size=5)
+        self.assertEqual(len(page), 5)
+        self.assertIsNone(cursor)
+
+    def test_changes_drop_the_cached_set_on_commit(self):
+        upload = Upload.objects.create(title="new", media_type="image")
+        self.assertEqual(len(bookmarked_ids(self.user)), 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bookmark = Bookmark.objects.create(author=self.user, upload=upload)
+            # not committed yet, the cached set stays
+            self.assertIsNotNone(caches["shared"].get(cache_key(self.user.pk)))
+        self.assertIn(upload.pk, bookmarked_ids(self.user))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bookmark.delete()
+        self.assertNotIn(upload.pk, bookmarked_ids(self.user))
+
+
+class CommentCursorTest(SimpleTestCase):
+    def test_cursor_round_trip(self):
+        from datetime import datetime, timezone
+        from .models import Comment
+
+        posted = datetime(2023, 3, 30, 14, 11, 5, 123456, tzinfo=timezone.utc)
+        cursor = encode_cursor(Comment(pk=42, date_posted=posted))
+        self.assertEqual(decode_cursor(cursor), (posted, 42))
+
+    def test_broken_cursor_is_ignored(self):
+        self.assertIsNone(decode_cursor("not a cursor"))
+
+
+class CommentThreadViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.upload = Upload.objects.create(title="Town hall", media_type="document")
+        cls.comments = [
+            Comment.objects.create(upload=cls.upload, content=f"comment {n}") for n in range(3)
+        ]
+
+    @override_settings(COMMENTS_PER_PAGE=2)
+    def test_newest_page_polls_from_the_newest_comment(self):
+        response = self.client.get(reverse("the_archive-thread", args=[self.upload.pk]))
+        self.assertTrue(response.context["live"])
+        self.assertEqual(response.context["newest"], encode_cursor(self.comments[-1]))
+        self.assertContains(response, "loadNewer")
+
+    @override_settings(COMMENTS_PER_PAGE=2)
+    def test_older_pages_do_not_poll(self):
+        url = reverse("the_archive-thread", args=[self.upload.pk])
+        older = self.client.get(url).context["older"]
+        response = self.client.get(url, {"before": older})
+        self.assertEqual(list(response.context["comments"]), self.comments[:1])
+        self.assertFalse(response.context["live"])
+        self.assertNotContains(response, "loadNewer")
+
+
+class StaticFilesTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        os.makedirs(os.path.join(self.tmp.name, "the_archive"))
+        for name in ("main.css", "main.0123abcd.css"):
+            path = os.path.join(self.tmp.name, "the_archive", name)
+            with open(path, "w") as file:
+                file.write("body { color: white; }\n" * 100)
+            compress_file(path)
+        with open(os.path.join(self.tmp.name, "staticfiles.json"), "w") as file:
+            file.write('{"paths": {"the_archive/main.css": "the_archive/main.0123abcd.css"}}')
+
+        static = override_settings(STATIC_ROOT=self.tmp.name, STATIC_URL="static/")
+        static.enable()
+        self.addCleanup(static.disable)
+        self.middleware = StaticFilesMiddleware(lambda request: HttpResponse("app"))
+
+    def get(self, path, accept_encoding=""):
+        request = RequestFactory().get(path, HTTP_ACCEPT_ENCODING=accept_encoding)
+        return self.middleware(request)
+
+    def test_hashed_files_are_immutable_and_negotiated(self):
+        response = self.get("/static/the_archive/main.0123abcd.css", "gzip, deflate, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(response["Content-Type"], "text/css")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertIn("immutable", response["Cache-Control"])
+
+        response = self.get("/static/the_archive/main.0123abcd.css", "gzip, br;q=0")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_not_modified_keeps_the_caching_headers(self):
+        request = RequestFactory().get(
+            "/static/the_archive/main.0123abcd.css",
+            HTTP_IF_MODIFIED_SINCE="Fri, 31 Dec 9999 23:59:59 GMT",
+        )
+        response = self.middleware(request)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertIn("immutable", response["Cache-Control"])
+
+    def test_pages_render_before_collectstatic(self):
+        with tempfile.TemporaryDirectory() as empty, override_settings(STATIC_ROOT=empty):
+            html = render_to_string("the_archive/about.html")
+        self.assertIn("/static/the_archive/main.css", html)
+
+    def test_plain_names_are_revalidated(self):
+        response = self.get("/static/the_archive/main.css")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertNotIn("immutable", response["Cache-Control"])
+
+    def test_everything_else_reaches_the_app(self):
+        for path in ("/static/missing.css", "/static/../manage.py", "/archive/"):
+            self.assertEqual(self.get(path).content, b"app")
@@ -0,0 +1,136 @@
+"""
+Token bucket throttling shared by every worker through a django cache.
+
+Views opt in with @throttle("scope") or a throttle_scope attribute,
+limits are configured per scope in settings.THROTTLE_RATES, e.g.
+    "upload": {"user": "20/hour", "ip": "40/hour", "media_type": {"video": "5/hour"}}
+Every bucket holds `num` tokens and refills at `num / period`, so bursts up to
+the limit are allowed while the long term rate stays at the limit.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """ turns "20/hour" into (20, 3600) """
+    num, period = rate.split("/")
+    return int(num), PERIODS[period.strip()[0]]
+
+
+def client_ip(request):
+    return request.META.get("REMOTE_ADDR", "")
+
+
+class TokenBucket:
+    """
+    A bucket stored as (tokens, timestamp) in settings.THROTTLE_CACHE.
+    get and set are not atomic, so concurrent requests may occasionally
+    both get a token; that is fine for throttling.
+    """
+
+    def __init__(self, key, rate):
+        self.key = f"throttle:{key}"
+        self.capacity, period = parse_rate(rate)
+        self.refill_rate = self.capacity / period
+        self.cache = caches[settings.THROTTLE_CACHE]
+
+    def peek(self, now):
+        """ returns (tokens after refilling, seconds until one token is available) """
+        tokens, last = self.cache.get(self.key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - last) * self.refill_rate)
+        if tokens < 1:
+            return tokens, math.ceil((1 - tokens) / self.refill_rate)
+        return tokens, 0
+
+    def take(self, tokens, now):
+        timeout = math.ceil(self.capacity / self.refill_rate)
+        self.cache.set(self.key, (tokens - 1, now), timeout)
+
+    def consume(self, now=None):
+        """ takes a token and returns 0, or returns the seconds until one is available """
+        now = time.time() if now is None else now
+        tokens, retry_after = self.peek(now)
+        if not retry_after:
+            self.take(tokens, now)
+        return retry_after
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse("Too many requests, try again later.", status=429)
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def reject(buckets, now=None):
+    """
+    returns a 429 response if any bucket is empty, otherwise takes one token
+    from each. A rejected request takes nothing, so a throttled user doesn't
+    drain the per ip bucket shared with everyone behind the same address.
+    """
+    now = time.time() if now is None else now
+    states = [bucket.peek(now) for bucket in buckets]
+    retry_after = max([retry for _, retry in states], default=0)
+    if retry_after:
+        return too_many_requests(retry_after)
+    for bucket, (tokens, _) in zip(buckets, states):
+        bucket.take(tokens, now)
+    return None
+
+
+def check(scope, request):
+    """
+    applies the per user, per ip and per media type limits of a scope.
+    The media type is read from the ?media_type= query parameter, so the
+    (possibly huge) body doesn't have to be parsed to find it.
+    """
+    rates = settings.THROTTLE_RATES.get(scope, {})
+    buckets = []
+    ident = request.user.pk if request.user.is_authenticated else client_ip(request)
+    if request.user.is_authenticated and "user" in rates:
+        buckets.append(TokenBucket(f"{scope}:user:{request.user.pk}", rates["user"]))
+    if "ip" in rates:
+        buckets.append(TokenBucket(f"{scope}:ip:{client_ip(request)}", rates["ip"]))
+    media_type = request.GET.get("media_type")
+    if media_type in rates.get("media_type", {}):
+        buckets.append(
+            TokenBucket(f"{scope}:{media_type}:{ident}", rates["media_type"][media_type])
+        )
+    return reject(buckets)
+
+
+def throttle(scope):
+    """ marks a function based view as throttled, class based views set throttle_scope """
+
+    def decorator(view):
+        view.throttle_scope = scope
+        return view
+
+    return decorator
+
+
+class ThrottleMiddleware:
+    """
+    Enforces the user, ip and media type limits of throttled views on POST requests.
+    Has to come before CsrfViewMiddleware, which reads request.POST, so that
+    rejected requests never have their body read.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "view_class", None)
+        scope = getattr(view_class or view_func, "throttle_scope", None)
+        if scope is None or request.method != "POST":
+            return None
+        return check(scope, request)
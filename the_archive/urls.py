@@ -1,10 +1,14 @@
 from django.urls import path
 from . import views
-from the_archive.views import UploadListView, UploadDataView
+from the_archive.views import UploadListView, UploadDataView, CommentCreateView
 
 urlpatterns = [
     path("", views.home, name="the_archive-home"),
     path("about/", views.about, name="the_archive-about"),
     path("archive/", UploadListView.as_view(), name="the_archive-list"),
-    path("archive/upload/", UploadDataView.as_view(), name="the_archive-upload")
+    path("archive/upload/", UploadDataView.as_view(), name="the_archive-upload"),
+    path("archive/<int:pk>/comment/", CommentCreateView.as_view(), name="the_archive-comment"),
+    path("archive/<int:pk>/comments/", views.comment_thread, name="the_archive-thread"),
+    path("archive/<int:pk>/comments/newer/", views.comments_newer, name="the_archive-thread-newer"),
+    path("bookmarks/", views.bookmark_list, name="the_archive-bookmarks"),
 ]
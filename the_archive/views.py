@@ -1,10 +1,15 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import JsonResponse
+from django.shortcuts import render, get_object_or_404
 
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView
 from django.views.generic.edit import CreateView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from .models import User, Upload, Location, Link
-from .forms import UploadForm
+from .forms import UploadForm, CommentForm
+from . import bookmarks, comments
 
 
 def home(request):
@@ -16,19 +21,85 @@ def about(request):
     return render(request, "the_archive/about.html", {"title": "About"})
 
 
+@login_required
+def bookmark_list(request):
+    before = request.GET.get("before")
+    page, cursor = bookmarks.bookmark_page(
+        request.user, before=int(before) if before and before.isdigit() else None
+    )
+    context = {"title": "Bookmarks", "bookmarks": page, "cursor": cursor}
+    return render(request, "the_archive/bookmarks.html", context)
+
+
+def comment_thread(request, pk):
+    upload = get_object_or_404(Upload, pk=pk)
+    before = request.GET.get("before")
+    page, older = comments.older_page(upload, before=before)
+    # only the newest page is refreshed live, polling from the last comment of
+    # an older page would pull in the rest of the thread
+    live = not before
+    context = {
+        "title": upload.title,
+        "upload": upload,
+        "comments": page,
+        "older": older,
+        "live": live,
+        "newest": comments.encode_cursor(page[-1]) if live and page else "",
+    }
+    return render(request, "the_archive/comment_thread.html", context)
+
+
+def comments_newer(request, pk):
+    """ comments posted after the `after` cursor, polled by the thread page """
+    upload = get_object_or_404(Upload, pk=pk)
+    page, more = comments.newer_page(upload, after=request.GET.get("after", ""))
+    data = {
+        "comments": [
+            {
+                "id": comment.pk,
+                "author": comment.author.username if comment.author else None,
+                "avatar": comments.avatar_url(comment.author),
+                "content": comment.content,
+                "date_posted": comment.date_posted.isoformat(),
+            }
+            for comment in page
+        ],
+        "cursor": comments.encode_cursor(page[-1]) if page else request.GET.get("after", ""),
+        "more": more,
+    }
+    return JsonResponse(data)
+
+
 class UploadListView(ListView):
     model = Upload
     context_object_name = "list_of_uploads"
     template_name = "upload_list.html"
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # one lookup for the whole list, usually answered from the cache
+        context["bookmarked"] = bookmarks.is_bookmarked(
+            self.request.user, [upload.pk for upload in context["list_of_uploads"]]
+        )
+        return context
+
 
 class UploadDataView(CreateView):
     model = Upload
     template_name = "the_archive/upload_data.html"
     form_class= UploadForm
     success_url = reverse_lazy('the_archive-list')
+    throttle_scope = "upload"
 
     def form_valid(self, form):
+        # ThrottleMiddleware limits by the media type in the url, before the
+        # body is read, so a limited type has to be declared there truthfully
+        media_type = form.cleaned_data["media_type"]
+        limited = settings.THROTTLE_RATES.get(self.throttle_scope, {}).get("media_type", {})
+        if media_type in limited and media_type != self.request.GET.get("media_type"):
+            form.add_error("media_type", "The media type doesn't match the upload url.")
+            return self.form_invalid(form)
+
         # self.request.FILES is a dict
         # each entry is an UploadedFiles object
         # https://docs.djangoproject.com/en/2.1/ref/files/uploads/#uploaded-files
@@ -41,4 +112,18 @@ class UploadDataView(CreateView):
             print("____________")
 
         form.save()
-        return super().form_valid(form)
\ No newline at end of file
+        return super().form_valid(form)
+
+
+class CommentCreateView(LoginRequiredMixin, CreateView):
+    form_class = CommentForm
+    template_name = "the_archive/comment_form.html"
+    throttle_scope = "comment"
+
+    def get_success_url(self):
+        return reverse("the_archive-thread", args=[self.kwargs["pk"]])
+
+    def form_valid(self, form):
+        form.instance.upload = get_object_or_404(Upload, pk=self.kwargs["pk"])
+        form.instance.author = self.request.user
+        return super().form_valid(form)
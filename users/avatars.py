@@ -0,0 +1,107 @@
+"""
+Fixed size avatars for users.Profile.image.
+
+Uploaded profile pictures are served at full size otherwise. The resize_avatars
+command cuts every new picture into squares of settings.AVATAR_SIZES, once as
+WebP and once as JPEG, re-encoded without their EXIF data. It runs as a worker
+so requests never wait for Pillow; until it has caught up the {% avatar %} tag
+falls back to the original picture.
+"""
+from hashlib import md5
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+
+from .models import Profile
+
+
+AVATAR_DIR = "profile_pics/avatars"
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 6}),
+    "jpg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+
+def variant_name(source, size, extension):
+    """ the path of one variant, derived from the source so it never goes stale """
+    digest = md5(source.encode()).hexdigest()[:16]
+    return f"{AVATAR_DIR}/{digest}-{size}.{extension}"
+
+
+def make_variants(source):
+    """ writes every size and format of the source image to the default storage """
+    from PIL import Image, ImageOps
+
+    largest = max(settings.AVATAR_SIZES)
+    with default_storage.open(source) as file:
+        image = Image.open(file)
+        # let the jpeg decoder downscale while reading, much cheaper than resizing later
+        image.draft("RGB", (largest * 2, largest * 2))
+        # apply the EXIF rotation before the EXIF data is dropped
+        image = ImageOps.exif_transpose(image).convert("RGB")
+
+    for size in settings.AVATAR_SIZES:
+        square = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        for extension, (fmt, options) in FORMATS.items():
+            buffer = BytesIO()
+            # no exif= argument, so the output carries no metadata
+            square.save(buffer, fmt, **options)
+            name = variant_name(source, size, extension)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def pending_profiles():
+    """ profiles whose current picture has no variants yet and hasn't failed before """
+    return Profile.objects.filter(
+        Q(resized_from__isnull=True) | ~Q(resized_from=F("image"))
+    ).exclude(resize_failed=F("image"))
+
+
+def resize_avatars(everything=False, limit=None):
+    """
+    makes the variants of every profile picture that has none yet, or of all of
+    them with everything=True, which also retries earlier failures.
+    Returns the number of resized source images and a list of (source, error).
+    """
+    from PIL import Image
+
+    profiles = Profile.objects.all() if everything else pending_profiles()
+    sources = list(profiles.order_by("image").values_list("image", flat=True).distinct()[:limit])
+    resized, failed = 0, []
+    for source in sources:
+        try:
+            make_variants(source)
+        except (OSError, ValueError, Image.DecompressionBombError) as exc:
+            # a broken picture stays broken, don't retry it on every run
+            Profile.objects.filter(image=source).update(resize_failed=source)
+            failed.append((source, exc))
+            continue
+        Profile.objects.filter(image=source).update(resized_from=source, resize_failed=None)
+        resized += 1
+    return resized, failed
+
+
+def avatar_urls(profile, size):
+    """
+    {"webp": ..., "jpg": ..., "webp_2x": ..., "jpg_2x": ...} for the smallest
+    variant at least `size` wide, or None while the variants are missing
+    """
+    if not profile or not profile.image or profile.resized_from != profile.image.name:
+        return None
+    sizes = sorted(settings.AVATAR_SIZES)
+
+    def pick(wanted):
+        return next((s for s in sizes if s >= wanted), sizes[-1])
+
+    urls = {}
+    for extension in FORMATS:
+        urls[extension] = default_storage.url(variant_name(profile.image.name, pick(size), extension))
+        urls[f"{extension}_2x"] = default_storage.url(
+            variant_name(profile.image.name, pick(size * 2), extension)
+        )
+    return urls
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+import time
+
+from users.avatars import resize_avatars
+
+
+class Command(BaseCommand):
+    """ Django command to make the fixed size avatars of profile pictures"""
+    help = "Resizes new profile pictures to the avatar sizes, --all backfills every profile."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="resize every profile picture")
+        parser.add_argument("--limit", type=int, default=None, help="pictures to resize per run")
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="keep running and resize every INTERVAL seconds",
+        )
+
+    def handle(self, *args, **kwargs):
+        while True:
+            resized, failed = resize_avatars(everything=kwargs["all"], limit=kwargs["limit"])
+            self.stdout.write(f"resized {resized} profile pictures")
+            for source, exc in failed:
+                self.stderr.write(f"could not resize {source}: {exc}")
+            if not kwargs["interval"]:
+                break
+            time.sleep(kwargs["interval"])
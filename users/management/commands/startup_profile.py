@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from collections import defaultdict
+import os
+import subprocess
+import sys
+
+
+# runs in a fresh interpreter, so nothing is already in sys.modules.
+# get_wsgi_application() also loads every middleware, like a booting worker does
+BOOT_SCRIPT = (
+    "import time; start = time.perf_counter(); "
+    "import django; django.setup(); "
+    "setup = time.perf_counter() - start; "
+    "from django.core.wsgi import get_wsgi_application; get_wsgi_application(); "
+    "print(setup, time.perf_counter() - start)"
+)
+
+
+def parse_importtime(stderr):
+    """ sums the self time of every import by its top level package, in seconds """
+    packages = defaultdict(float)
+    for line in stderr.splitlines():
+        # lines look like: "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].strip().split(".")[0]
+        packages[name] += int(fields[0]) / 1_000_000
+    return dict(packages)
+
+
+def profile_startup(environ=None):
+    """
+    boots django in a subprocess, with `environ` added to its environment, and returns
+    (seconds for django.setup(), seconds until the WSGI application is ready, {package: seconds})
+    """
+    env = dict(os.environ, **(environ or {}))
+    env.setdefault("DJANGO_SETTINGS_MODULE", "civic_platform.settings")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", BOOT_SCRIPT],
+        cwd=settings.BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise CommandError(f"django failed to boot:\n{result.stderr[-2000:]}")
+    setup, total = map(float, result.stdout.strip().splitlines()[-1].split())
+    return setup, total, parse_importtime(result.stderr)
+
+
+class Command(BaseCommand):
+    """ Django command to report how long a cold boot spends importing each package"""
+    help = "Boots django in a fresh interpreter and prints an import-time breakdown."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=20, help="number of packages to list")
+        parser.add_argument(
+            "--budget",
+            type=float,
+            default=settings.STARTUP_TIME_BUDGET,
+            help="fail if the cold boot takes longer than this many seconds",
+        )
+
+    def handle(self, *args, **kwargs):
+        setup, total, packages = profile_startup()
+        ranking = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+        self.stdout.write(f"{'package':<30} {'seconds':>10}")
+        for name, seconds in ranking[: kwargs["limit"]]:
+            self.stdout.write(f"{name:<30} {seconds:>10.4f}")
+        self.stdout.write(f"{'imports total':<30} {sum(packages.values()):>10.4f}")
+        self.stdout.write(f"{'django.setup()':<30} {setup:>10.4f}")
+        self.stdout.write(f"{'get_wsgi_application()':<30} {total:>10.4f}")
+
+        if total > kwargs["budget"]:
+            raise CommandError(f"cold boot took {total:.2f}s, budget is {kwargs['budget']:.2f}s")
+        self.stdout.write(self.style.SUCCESS(f"cold boot within budget of {kwargs['budget']:.2f}s"))
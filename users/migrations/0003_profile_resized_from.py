@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-19 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0002_remove_profile_id_alter_profile_user"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="resized_from",
+            field=models.CharField(editable=False, max_length=100, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-19 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0003_profile_resized_from"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="resize_failed",
+            field=models.CharField(editable=False, max_length=100, null=True),
+        ),
+    ]
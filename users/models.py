@@ -11,6 +11,10 @@ class Profile(models.Model):
         on_delete=models.CASCADE,
     )
     image = models.ImageField(default='default.jpg', upload_to='profile_pics')
+    # the image the avatar sizes were made from, see users/avatars.py
+    resized_from = models.CharField(max_length=100, null=True, editable=False)
+    # the image resizing failed on, skipped until the picture changes
+    resize_failed = models.CharField(max_length=100, null=True, editable=False)
 
     def __str__(self) -> str:
         return f"{self.user.username} Profile"
\ No newline at end of file
@@ -0,0 +1,32 @@
+from django import template
+from django.utils.html import format_html
+
+from users.avatars import avatar_urls
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar(user, size=64):
+    """
+    {% avatar user 64 %} renders the smallest stored avatar at least `size` pixels
+    wide, WebP where the browser takes it, and twice that size on high dpi screens
+    """
+    profile = getattr(user, "profile", None)
+    if not profile or not profile.image:
+        return ""
+    alt = user.username
+    urls = avatar_urls(profile, size)
+    if urls is None:
+        # not resized yet, fall back to the uploaded picture
+        return format_html(
+            '<img class="rounded-circle" src="{}" width="{}" height="{}" alt="{}">',
+            profile.image.url, size, size, alt,
+        )
+    return format_html(
+        '<picture><source type="image/webp" srcset="{} 1x, {} 2x">'
+        '<img class="rounded-circle" src="{}" srcset="{} 2x" width="{}" height="{}" alt="{}">'
+        "</picture>",
+        urls["webp"], urls["webp_2x"], urls["jpg"], urls["jpg_2x"], size, size, alt,
+    )
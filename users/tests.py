@@ -1,3 +1,84 @@
-from django.test import TestCase
+from io import BytesIO
+import os
+import tempfile
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .avatars import make_variants, pending_profiles, resize_avatars, variant_name
+from .management.commands.startup_profile import parse_importtime, profile_startup
+from .models import Profile
+
+
+class StartupProfileTest(SimpleTestCase):
+    def test_parse_importtime_groups_by_package(self):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       500 |        500 |   django.utils\n"
+            "import time:      1500 |       2000 | django\n"
+            "import time:      1000 |       1000 | magic\n"
+        )
+        self.assertEqual(parse_importtime(stderr), {"django": 0.002, "magic": 0.001})
+
+    def test_cold_boot_within_budget(self):
+        # the test runner turns DEBUG off in this process only, a deployed boot has it off too
+        setup, total, packages = profile_startup({"DEBUG": "0"})
+        self.assertNotIn("magic", packages)
+        self.assertNotIn("django_extensions", packages)
+        self.assertLessEqual(setup, total)
+        self.assertLess(total, settings.STARTUP_TIME_BUDGET)
+
+
+class AvatarTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        media = override_settings(MEDIA_ROOT=self.tmp.name, AVATAR_SIZES=(32, 64))
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def test_variants_are_square_and_without_exif(self):
+        from PIL import Image
+
+        exif = Image.Exif()
+        exif[0x0112] = 6  # orientation: rotated 90 degrees
+        exif[0x010F] = "Phone maker"
+        buffer = BytesIO()
+        Image.new("RGB", (400, 200), "red").save(buffer, "JPEG", exif=exif)
+        os.makedirs(os.path.join(self.tmp.name, "profile_pics"))
+        with open(os.path.join(self.tmp.name, "profile_pics", "me.jpg"), "wb") as file:
+            file.write(buffer.getvalue())
+
+        make_variants("profile_pics/me.jpg")
+
+        for size in (32, 64):
+            for extension in ("webp", "jpg"):
+                with default_storage.open(variant_name("profile_pics/me.jpg", size, extension)) as file:
+                    image = Image.open(file)
+                    image.load()
+                self.assertEqual(image.size, (size, size))
+                self.assertEqual(len(image.getexif()), 0)
+
+
+class ResizeFailureTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        media = override_settings(MEDIA_ROOT=self.tmp.name, AVATAR_SIZES=(32,))
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def test_broken_pictures_are_not_retried(self):
+        os.makedirs(os.path.join(self.tmp.name, "profile_pics"))
+        with open(os.path.join(self.tmp.name, "profile_pics", "broken.jpg"), "wb") as file:
+            file.write(b"not an image")
+        user = User.objects.create_user("painter")
+        Profile.objects.create(user=user, image="profile_pics/broken.jpg")
+
+        resized, failed = resize_avatars()
+        self.assertEqual(resized, 0)
+        self.assertEqual([source for source, _ in failed], ["profile_pics/broken.jpg"])
+        self.assertFalse(pending_profiles().exists())
+        self.assertEqual(resize_avatars(), (0, []))
@@ -1,9 +1,11 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from the_archive.throttling import throttle
 from .forms import UserRegisterForm
 
 
+@throttle("register")
 def register(request):
     if request.method == 'POST':
         form = UserRegisterForm(request.POST)